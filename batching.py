@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+MESSAGE_LIMIT = 4096 # Telegram's maximum message length
+
+
+class MessageBatcher:
+    """Queues text and sends it from one background task in coalesced messages,
+    so a burst of lines costs one send per batch instead of one per line.
+
+    A message goes out once `max_chars` characters or `max_items` entries are
+    pending, or `flush_seconds` after its first entry. An entry that would take
+    the message past `limit` starts the next one. `deliver` is the coroutine
+    function that sends the joined text; `render` turns a queued item into its
+    text and runs in the worker, off the caller's path.
+    """
+
+    def __init__(self, deliver, flush_seconds, max_chars=None, max_items=None, limit=MESSAGE_LIMIT, render=str):
+        self.deliver = deliver
+        self.flush_seconds = flush_seconds
+        self.max_chars = max_chars
+        self.max_items = max_items
+        self.limit = limit
+        self.render = render
+        self.queue = asyncio.Queue()
+        self._worker_task = None
+
+    def start(self):
+        self._worker_task = asyncio.create_task(self._worker())
+
+    def put(self, item):
+        """Queues an item without waiting for it to be sent."""
+        self.queue.put_nowait(item)
+
+    async def close(self):
+        """Waits for every queued item to be sent, then stops the worker."""
+        await self.queue.join()
+        self._worker_task.cancel()
+
+    def _full(self, count, size):
+        return ((self.max_items is not None and count >= self.max_items)
+                or (self.max_chars is not None and size >= self.max_chars))
+
+    async def _worker(self):
+        carry = None
+        while True:
+            first = carry if carry is not None else self.render(await self.queue.get())
+            carry = None
+            texts, size = [first], len(first)
+            deadline = time.monotonic() + self.flush_seconds
+            while not self._full(len(texts), size):
+                try:
+                    text = self.render(await asyncio.wait_for(self.queue.get(), deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    break
+                if size + 1 + len(text) > self.limit:
+                    carry = text # Starts the next message instead
+                    break
+                texts.append(text)
+                size += 1 + len(text)
+            await self.deliver("\n".join(texts))
+            for _ in texts:
+                self.queue.task_done()
@@ -1,18 +1,31 @@
 import os
 import asyncio
-from telethon.sync import TelegramClient
-from telethon.sessions import StringSession
+import logging
 from telethon.errors import FloodWaitError, MessageDeleteForbiddenError
 
-# --- HELPER FUNCTION TO PARSE IDs ---
-def parse_id(value):
-    value = value.strip()
-    if value.isdigit():
-        return int(value)
-    elif '/' in value:
-        return int(value.split('/')[-1])
-    else:
-        raise ValueError(f"Invalid format for message ID: {value}")
+from common import configure_logging, get_client, install_uvloop, parse_tasks, resolve_channels
+from ratelimit import TokenBucket
+
+DELETE_CONCURRENCY = 4 # Chunks deleted in parallel; kept low to avoid FLOOD_WAIT
+PROGRESS_EVERY = 10 # Log every Nth deleted chunk at INFO, the others at DEBUG (errors are always logged)
+
+# Console progress from the deletion loop; startup and fatal messages stay plain prints
+log = logging.getLogger('deleter')
+
+def chunked_ids(ranges, size):
+    """Lazily yields lists of up to `size` message IDs covering the (start, end) ranges."""
+    buf = []
+    for start, end in ranges:
+        msg_id = start
+        while msg_id <= end:
+            take = min(size - len(buf), end - msg_id + 1)
+            buf.extend(range(msg_id, msg_id + take))
+            msg_id += take
+            if len(buf) == size:
+                yield buf
+                buf = []
+    if buf:
+        yield buf
 
 async def main():
     print("--- BULK DELETE SCRIPT INITIALIZING ---")
@@ -29,71 +42,75 @@ async def main():
         return
 
     # --- 2. PARSE RANGES FROM FILE ---
-    all_message_ids = []
     try:
         # Note the path to the file inside the 'bulkdelete' folder
-        with open('bulkdelete/delete_range.txt', 'r') as f:
-            lines = f.readlines()
+        tasks = parse_tasks('bulkdelete/delete_range.txt')
+        ranges = [(task['start'], task['end']) for task in tasks if task['type'] == 'range']
         
-        start_id = None
-        for line in lines:
-            line = line.strip()
-            if not line or line.startswith('#'): continue
-            parts = line.split(':', 1)
-            if len(parts) != 2: continue
-            key, value = parts[0].strip().lower(), parts[1].strip()
-
-            if key == 'start':
-                start_id = parse_id(value)
-            elif key == 'end' and start_id is not None:
-                end_id = parse_id(value)
-                all_message_ids.extend(range(start_id, end_id + 1))
-                start_id = None
-        
-        if not all_message_ids:
+        total = sum(end - start + 1 for start, end in ranges)
+        if not total:
              raise ValueError("delete_range.txt contains no valid Start/End pairs.")
-        print(f"✅ Successfully parsed delete_range.txt. Total messages to delete: {len(all_message_ids)}")
+        print(f"✅ Successfully parsed delete_range.txt. Total messages to delete: {total}")
 
     except Exception as e:
         print(f"🔴 FATAL ERROR: Could not read or parse delete_range.txt. Details: {e}")
         return
 
     # --- 3. TELEGRAM CLIENT INITIALIZATION ---
-    client = TelegramClient(StringSession(session_string), api_id, api_hash, timeout=60)
+    client = get_client(api_id, api_hash, session_string)
     
-    async with client:
+    await client.connect()
+    try:
         print("✅ Telegram client connected.")
         try:
-            target_entity = await client.get_entity(target_channel_id)
-            print(f"✅ Target entity found: '{target_entity.title}'")
+            [(target_entity, target_title)] = await resolve_channels(client, int(target_channel_id))
+            print(f"✅ Target entity found: '{target_title}'")
         except Exception as e:
             print(f"🔴 FATAL ERROR: Could not find the target channel. Details: {e}")
             return
             
         # --- 4. DELETE MESSAGES IN BATCHES OF 100 ---
         chunk_size = 100
-        chunks = [all_message_ids[i:i + chunk_size] for i in range(0, len(all_message_ids), chunk_size)]
+        num_chunks = -(-total // chunk_size)
+        chunks = enumerate(chunked_ids(ranges, chunk_size), 1)
         
-        print(f"\n--- Starting deletion of {len(all_message_ids)} messages in {len(chunks)} chunks ---")
+        print(f"\n--- Starting deletion of {total} messages in {num_chunks} chunks ---")
         
-        for i, chunk in enumerate(chunks, 1):
-            print(f"  Deleting chunk {i}/{len(chunks)} ({len(chunk)} messages)...")
-            try:
-                await client.delete_messages(target_entity, chunk)
-                print(f"    -> ✅ SUCCESS: Chunk {i} deleted.")
-            except MessageDeleteForbiddenError:
-                print(f"    -> 🔴 ERROR: You do not have permission to delete messages in this channel.")
-                break
-            except FloodWaitError as e:
-                print(f"    -> 🟡 WARNING: FloodWaitError. Pausing for {e.seconds + 5} seconds.")
-                await asyncio.sleep(e.seconds + 5)
-            except Exception as e:
-                print(f"    -> 🔴 ERROR: An unexpected error occurred on chunk {i}: {e}")
+        bucket = TokenBucket(rate=0.5, max_rate=DELETE_CONCURRENCY)
+        forbidden = asyncio.Event()
+
+        # Workers pull chunks from the shared generator, so only DELETE_CONCURRENCY chunks exist at once
+        async def delete_worker():
+            for i, chunk in chunks:
+                if forbidden.is_set():
+                    return
+                while True:
+                    try:
+                        async with bucket:
+                            await client.delete_messages(target_entity, chunk)
+                        level = logging.INFO if i % PROGRESS_EVERY == 0 or i == num_chunks else logging.DEBUG
+                        log.log(level, "  ✅ Deleted chunk %d/%d.", i, num_chunks)
+                    except MessageDeleteForbiddenError:
+                        log.error("    -> 🔴 ERROR: You do not have permission to delete messages in this channel.")
+                        forbidden.set()
+                        return
+                    except FloodWaitError as e:
+                        # Pauses every worker through the shared bucket, then retries this chunk
+                        log.warning("    -> 🟡 WARNING: FloodWaitError. Pausing for %d seconds.", e.seconds + 5)
+                        bucket.on_flood_wait(e.seconds + 5)
+                        continue
+                    except Exception as e:
+                        log.error("    -> 🔴 ERROR: An unexpected error occurred on chunk %d: %s", i, e)
+                    break
 
-            await asyncio.sleep(2) # Always add a small delay between batches to be safe
+        await asyncio.gather(*(delete_worker() for _ in range(DELETE_CONCURRENCY)))
             
         print("\n--- ✅ Deletion process complete ---")
+    finally:
+        await client.disconnect()
 
 if __name__ == "__main__":
+    configure_logging()
+    install_uvloop()
     asyncio.run(main())
       
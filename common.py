@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import re
+import sys
+
+from telethon import TelegramClient
+from telethon.errors import ChannelInvalidError, ChannelPrivateError
+from telethon.sessions import StringSession
+from telethon.tl.functions.channels import GetChannelsRequest
+from telethon.tl.types import ChannelForbidden, InputChannel, InputPeerChannel
+from telethon.utils import get_input_peer
+
+# Resolved channel peers by numeric ID, so later runs skip get_entity
+ENTITY_CACHE_FILE = '.entity_cache.json'
+
+# One `key: value` task line; keys are matched case-insensitively, anything else is ignored
+TASK_LINE_RE = re.compile(rb'[^\S\n]*(message|start|end)[^\S\n]*:[^\S\n]*(.*?)\s*$', re.IGNORECASE)
+
+
+def parse_id(value):
+    """Parses message IDs from various formats (raw number, link).
+
+    Raw numbers are tried first with a single int(); links fall back to the part
+    after the last '/'.
+    """
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(value.rsplit('/', 1)[-1])
+    except ValueError:
+        raise ValueError(f"Invalid format for message ID: {value}") from None
+
+
+def parse_tasks(path):
+    """Yields 'message' and 'range' tasks from a range file as it is read.
+
+    The file is read line by line and each line is matched against one
+    compiled regex, so the first task is available before the rest of the file
+    is parsed and memory stays flat however long the file is. Only message text
+    is decoded.
+    """
+    start_id = None
+    with open(path, 'rb') as f:
+        for line in f:
+            match = TASK_LINE_RE.match(line)
+            if not match:
+                continue
+            key, value = match.group(1).lower(), match.group(2)
+            if key == b'message':
+                yield {'type': 'message', 'content': value.decode('utf-8')}
+            elif key == b'start':
+                start_id = parse_id(value.decode())
+            elif start_id is not None:
+                yield {'type': 'range', 'start': start_id, 'end': parse_id(value.decode())}
+                start_id = None
+
+
+def configure_logging():
+    """Sends the scripts' progress logging to stdout as bare lines. LOG_LEVEL (default
+    INFO) picks the level: DEBUG adds per-chunk detail, WARNING keeps only problems."""
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(message)s', stream=sys.stdout)
+
+
+def install_uvloop():
+    """Runs asyncio on uvloop when it is installed; Telethon works unchanged on either loop."""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    uvloop.install()
+    print("✅ uvloop event loop enabled.")
+
+
+def get_client(api_id, api_hash, session_string):
+    """Builds the TelegramClient shared by the forward and delete scripts."""
+    return TelegramClient(StringSession(session_string), api_id, api_hash, timeout=60)
+
+
+async def resolve_channels(client, *channel_ids):
+    """Returns (input_peer, title) for each numeric channel ID.
+
+    Peers cached in ENTITY_CACHE_FILE are checked with a single GetChannels
+    request instead of one get_entity per channel, which also refreshes their
+    titles. Access hashes are only valid for the account that obtained them, so
+    a peer Telegram rejects (a rotated SESSION_STRING, a channel the account
+    left) is dropped and resolved again through get_entity, like a cache miss.
+    Only numeric IDs are cached, never usernames, which can change hands.
+    """
+    try:
+        with open(ENTITY_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cache = {}
+
+    updated = False
+    verified = {}
+    cached = {channel_id: cache[str(channel_id)] for channel_id in channel_ids if str(channel_id) in cache}
+    if cached:
+        try:
+            result = await client(GetChannelsRequest([InputChannel(peer_id, access_hash) for peer_id, access_hash, _ in cached.values()]))
+            chats = {chat.id: chat for chat in result.chats}
+        except (ChannelInvalidError, ChannelPrivateError):
+            chats = {}
+        for channel_id, (peer_id, access_hash, title) in cached.items():
+            chat = chats.get(peer_id)
+            if chat is None or isinstance(chat, ChannelForbidden):
+                del cache[str(channel_id)]
+                updated = True
+                continue
+            verified[channel_id] = (InputPeerChannel(peer_id, access_hash), chat.title)
+            if chat.title != title:
+                cache[str(channel_id)] = [peer_id, access_hash, chat.title]
+                updated = True
+
+    resolved = []
+    for channel_id in channel_ids:
+        if channel_id in verified:
+            resolved.append(verified[channel_id])
+            continue
+        entity = await client.get_entity(channel_id)
+        resolved.append((get_input_peer(entity), entity.title))
+        if getattr(entity, 'access_hash', None) is not None:
+            cache[str(channel_id)] = [entity.id, entity.access_hash, entity.title]
+            updated = True
+
+    if updated:
+        with open(ENTITY_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+    return resolved
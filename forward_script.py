@@ -1,13 +1,21 @@
 import os
+import json
 import asyncio
-import random
+import logging
+import time
 import traceback
-from datetime import datetime
+from contextlib import aclosing
+from datetime import timedelta
+from itertools import chain
 
 # --- Telethon for all user actions ---
 from telethon.sync import TelegramClient
-from telethon.sessions import StringSession
-from telethon.errors import FloodWaitError
+from telethon.errors import FloodWaitError, RPCError
+from telethon.tl.types import InputMessagesFilterPoll
+
+from batching import MessageBatcher
+from common import configure_logging, get_client, install_uvloop, parse_tasks, resolve_channels
+from ratelimit import TokenBucket
 
 # --- Load environment variables ---
 try:
@@ -24,35 +32,53 @@ SESSION_STRING = os.getenv('SESSION_STRING')
 SOURCE_CHANNEL = os.getenv('SOURCE_CHANNEL')
 DESTINATION_CHANNEL = os.getenv('DESTINATION_CHANNEL')
 LOG_CHANNEL_ID = os.getenv('LOG_CHANNEL_ID')
+# Watch mode: when > 0, stay connected after the run and re-run range.txt whenever it changes,
+# checking every WATCH_INTERVAL seconds. Unset (the default) keeps the single-shot behaviour.
+WATCH_INTERVAL = int(os.getenv('WATCH_INTERVAL') or 0)
+# Set to true to forget the resume points of interrupted ranges, so they are forwarded from their start again
+RESET_CURSOR = os.getenv('RESET_CURSOR', '').lower() in ('1', 'true', 'yes')
+RANGE_FILE = 'range.txt'
 
-# Safety & Performance
+# Safety & Performance (bounds of the adaptive rate limiter)
 MIN_DELAY_SECONDS = 1
 MAX_DELAY_SECONDS = 2
 BATCH_SIZE = 100 # Process 100 messages at a time
+FORWARD_LIMIT = 100 # Telegram's cap on message IDs per forwardMessages call
+PREFETCH_DEPTH = 1 # Fetched batches queued ahead of the one being forwarded
+POLL_CACHE_FILE = 'polls_cache.json' # Poll / non-poll IDs already seen per source channel, kept between runs
+CURSOR_FILE = 'cursor.json' # Last forwarded ID of each unfinished source:destination range, so an interrupted run resumes
+
+# Log coalescing: a log-channel message is sent once LOG_BATCH_CHARS are pending or LOG_FLUSH_SECONDS
+# have passed since its first line, which keeps the log channel well under its ~20 messages/minute cap
+LOG_BATCH_CHARS = 3500
+LOG_FLUSH_SECONDS = 5
+
+# Log line templates: the loops only queue the arguments, the log worker fills the template in
+TASK_HEADER_TMPL = "▶️ <b>Executing Task {}:</b> <code>{}</code>"
+BATCH_LOG_TMPL = "  - Processing batch <code>{}-{}</code>, found {} valid messages."
+SUMMARY_TMPL = (
+    "🎉 <b>All Tasks Complete!</b> 🎉\n\n"
+    "<b>📊 Final Stats:</b>\n"
+    "  - <b>Polls Forwarded:</b> <code>{polls_forwarded}</code>\n"
+    "  - <b>Non-Polls Skipped:</b> <code>{non_polls_skipped}</code>\n"
+    "  - <b>IDs Without Polls:</b> <code>{ids_without_polls}</code>\n"
+    "  - <b>Errors Encountered:</b> <code>{errors}</code>\n\n"
+    "⏱️ <b>Total Duration:</b> <code>{duration}</code>"
+)
+
+# Console progress from the forwarding loop; startup and fatal messages stay plain prints
+log = logging.getLogger('forwarder')
 
 # --- HELPER FUNCTIONS ---
 
-def parse_id(value):
-    """Parses message IDs from various formats (raw number, link)."""
-    value = str(value).strip()
-    if value.isdigit():
-        return int(value)
-    elif '/' in value:
-        try:
-            return int(value.split('/')[-1])
-        except (ValueError, IndexError):
-            raise ValueError(f"Invalid message link format: {value}")
-    else:
-        raise ValueError(f"Invalid format for message ID: {value}")
-
-async def send_log(client: TelegramClient, log_channel_id: int, text: str):
-    """Sends a formatted message to the log channel using the main client."""
-    if not client or not log_channel_id:
+async def send_log(client: TelegramClient, log_channel, text: str):
+    """Sends a formatted message to the log channel (integer ID or resolved input peer) using the main client."""
+    if not client or not log_channel:
         print(f"Log Message (not sent): {text}")
         return
     try:
         await client.send_message(
-            entity=log_channel_id,
+            entity=log_channel,
             message=text,
             parse_mode='html',
             link_preview=False
@@ -60,9 +86,305 @@ async def send_log(client: TelegramClient, log_channel_id: int, text: str):
     except Exception as e:
         print(f"🔴 CRITICAL: Failed to send log message. Error: {e}")
 
+class LogBatcher(MessageBatcher):
+    """Queues log lines and sends them to the log channel in coalesced messages,
+    so logging costs one RPC per batch instead of one per line."""
+
+    def __init__(self, client: TelegramClient, log_channel_id: int):
+        super().__init__(self._send_log, LOG_FLUSH_SECONDS, max_chars=LOG_BATCH_CHARS, render=self._render)
+        self.client = client
+        # Replaced by the resolved input peer once the channels are verified
+        self.log_channel = log_channel_id
+
+    def send(self, text: str, *args):
+        """Queues a log line; with `args`, `text` is a str.format template filled in by the worker."""
+        self.put((text, args))
+
+    @staticmethod
+    def _render(item):
+        text, args = item
+        return text.format(*args) if args else text
+
+    async def _send_log(self, text: str):
+        await send_log(self.client, self.log_channel, text)
+
+def load_poll_cache(source_id: int):
+    """Returns {message_id: is_poll} for the IDs of the source channel classified by earlier runs."""
+    try:
+        with open(POLL_CACHE_FILE, 'r', encoding='utf-8') as f:
+            entry = json.load(f).get(str(source_id), {})
+    except (FileNotFoundError, json.JSONDecodeError):
+        entry = {}
+    classified = dict.fromkeys(entry.get('nonpolls', []), False)
+    classified.update(dict.fromkeys(entry.get('polls', []), True))
+    return classified
+
+def save_poll_cache(source_id: int, classified: dict):
+    """Writes the classified IDs of the source channel back to POLL_CACHE_FILE."""
+    try:
+        with open(POLL_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        cache = {}
+    cache[str(source_id)] = {
+        'polls': sorted(msg_id for msg_id, is_poll in classified.items() if is_poll),
+        'nonpolls': sorted(msg_id for msg_id, is_poll in classified.items() if not is_poll),
+    }
+    with open(POLL_CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+
+class ResumeCursor:
+    """Tracks the last forwarded message ID of each unfinished range for one source →
+    destination pair and writes it to CURSOR_FILE after every forward, so a run that
+    crashed or was cut short resumes where it stopped. A range's entry is dropped
+    once it completes, so listing it again forwards it again (e.g. after a bulk
+    delete). Ranges are tracked separately, so tasks listed out of ID order don't
+    skip each other."""
+
+    def __init__(self, source_id: int, destination_id: int, reset: bool = False):
+        self.prefix = f"{source_id}:{destination_id}"
+        try:
+            with open(CURSOR_FILE, 'r', encoding='utf-8') as f:
+                self.cursors = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.cursors = {}
+        if reset:
+            self.cursors = {key: value for key, value in self.cursors.items() if not key.startswith(f"{self.prefix}:")}
+            self._save()
+
+    def last_forwarded(self, start: int, end: int) -> int:
+        last = self.cursors.get(f"{self.prefix}:{start}-{end}", start - 1)
+        # An entry at the range end is a finished range recorded by an older run
+        return last if last < end else start - 1
+
+    def advance(self, start: int, end: int, msg_id: int):
+        """Records that everything in [start, msg_id] has been forwarded."""
+        if msg_id <= self.last_forwarded(start, end):
+            return
+        self.cursors[f"{self.prefix}:{start}-{end}"] = msg_id
+        self._save()
+
+    def complete(self, start: int, end: int):
+        """Forgets a finished range, so a later run forwards it in full."""
+        if self.cursors.pop(f"{self.prefix}:{start}-{end}", None) is not None:
+            self._save()
+
+    def _save(self):
+        with open(CURSOR_FILE, 'w', encoding='utf-8') as f:
+            json.dump(self.cursors, f)
+
+async def forward_polls(client: TelegramClient, bucket: TokenBucket, destination_entity, source_entity, poll_ids):
+    """Forwards up to FORWARD_LIMIT polls in a single server-side call, paced by the bucket."""
+    async with bucket:
+        await client.forward_messages(destination_entity, poll_ids, source_entity)
+    log.info("    ✅ FORWARDED: %d polls (%d-%d).", len(poll_ids), poll_ids[0], poll_ids[-1])
+
+async def search_poll_ids(client: TelegramClient, source_entity, start: int, end: int):
+    """Returns the IDs of the polls in [start, end], oldest first, using Telegram's
+    server-side poll filter so non-poll messages are never downloaded."""
+    return [
+        message.id
+        async for message in client.iter_messages(
+            source_entity, filter=InputMessagesFilterPoll, min_id=start - 1, max_id=end + 1, reverse=True
+        )
+    ]
+
+async def prefetch_batches(client: TelegramClient, bucket: TokenBucket, source_entity, start: int, end: int, skip_ids=()):
+    """Yields (batch_start, batch_end, messages) for the range.
+
+    A producer task fetches batches into a queue bounded by PREFETCH_DEPTH, so
+    the next fetch runs while the caller forwards the current batch. Fetches
+    are paced by the bucket; IDs in `skip_ids` are not fetched.
+    """
+    queue = asyncio.Queue(maxsize=PREFETCH_DEPTH)
+
+    async def producer():
+        try:
+            for batch_start in range(start, end + 1, BATCH_SIZE):
+                batch_end = min(batch_start + BATCH_SIZE - 1, end)
+                batch_ids = range(batch_start, batch_end + 1) # get_messages accepts any list-like, including range
+                if skip_ids:
+                    batch_ids = [msg_id for msg_id in batch_ids if msg_id not in skip_ids]
+                messages = []
+                if batch_ids:
+                    async with bucket:
+                        messages = await client.get_messages(source_entity, ids=batch_ids)
+                await queue.put((batch_start, batch_end, messages))
+        except Exception as e:
+            await queue.put(e) # Re-raised on the consumer side
+            return
+        await queue.put(None)
+
+    producer_task = asyncio.create_task(producer())
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Reached when the consumer stops early (error, FloodWait): don't leave the producer running unobserved
+        producer_task.cancel()
+
+
+async def send_custom_message(client: TelegramClient, bucket: TokenBucket, destination_entity, content: str):
+    """Sends a custom text message from range.txt to the destination channel."""
+    async with bucket:
+        await client.send_message(destination_entity, content)
+
+async def forward_range(client: TelegramClient, bucket: TokenBucket, log_batcher: LogBatcher, source_entity, destination_entity,
+                        start: int, end: int, poll_cache: dict, cursor: ResumeCursor, stats: dict):
+    """Forwards every poll in [start, end] in order, updating `poll_cache` and `stats`.
+
+    Uses the server-side poll search and falls back to scanning the range in
+    batches when the search is unavailable. IDs up to the resume cursor
+    of an interrupted earlier run are skipped.
+    """
+    range_start, range_end = start, end
+    log_batcher.send(f"  🔎 Processing poll range <code>{start}-{end}</code>.")
+
+    resume_from = cursor.last_forwarded(range_start, range_end) + 1
+    if resume_from > start:
+        log_batcher.send(
+            f"  ⏩ Resuming after message <code>{resume_from - 1}</code>, forwarded by an interrupted run "
+            f"(set <code>RESET_CURSOR</code> to start over)."
+        )
+        start = resume_from
+
+    try:
+        poll_ids = await search_poll_ids(client, source_entity, start, end)
+        # The search returns only polls, so non-poll messages can't be told from deleted or missing IDs here
+        stats['ids_without_polls'] += (end - start + 1) - len(poll_ids)
+        log_batcher.send(f"  - Server-side filter found {len(poll_ids)} polls.")
+    except FloodWaitError:
+        raise
+    except RPCError as e:
+        poll_ids = None
+        log_batcher.send(f"  🟡 Poll search unavailable (<code>{e}</code>), scanning in batches of {BATCH_SIZE}.")
+
+    if poll_ids is None:
+        # Poll IDs are buffered across batches so poll-sparse ranges still forward full calls
+        poll_ids = []
+        # IDs classified by earlier runs are not fetched again
+        async with aclosing(prefetch_batches(client, bucket, source_entity, start, end, skip_ids=poll_cache)) as batches:
+            async for batch_start, batch_end, messages in batches:
+                # Single pass over the fetched messages: classify into the cache
+                found = 0
+                for m in messages:
+                    if m is not None:
+                        poll_cache[m.id] = m.poll is not None
+                        found += 1
+
+                if found:
+                    log_batcher.send(BATCH_LOG_TMPL, batch_start, batch_end, found)
+
+                # Single pass over the batch IDs: collect polls in order, count the rest
+                for msg_id in range(batch_start, batch_end + 1):
+                    is_poll = poll_cache.get(msg_id)
+                    if is_poll:
+                        poll_ids.append(msg_id)
+                    elif is_poll is False:
+                        stats['non_polls_skipped'] += 1
+
+                while len(poll_ids) >= FORWARD_LIMIT:
+                    await forward_polls(client, bucket, destination_entity, source_entity, poll_ids[:FORWARD_LIMIT])
+                    cursor.advance(range_start, range_end, poll_ids[FORWARD_LIMIT - 1])
+                    stats['polls_forwarded'] += FORWARD_LIMIT
+                    del poll_ids[:FORWARD_LIMIT]
+
+    for offset in range(0, len(poll_ids), FORWARD_LIMIT):
+        chunk = poll_ids[offset:offset + FORWARD_LIMIT]
+        await forward_polls(client, bucket, destination_entity, source_entity, chunk)
+        cursor.advance(range_start, range_end, chunk[-1])
+        stats['polls_forwarded'] += len(chunk)
+
+    # Whole range done: nothing left to resume
+    cursor.complete(range_start, range_end)
+
 
 # --- MAIN SCRIPT LOGIC ---
 
+def load_range_tasks():
+    """Opens range.txt and returns a lazy iterator over its tasks, or None (after
+    printing why) when it holds no usable tasks."""
+    tasks = parse_tasks(RANGE_FILE)
+    try:
+        # Only the first task is parsed up front, the rest are read as the run reaches them
+        first = next(tasks, None)
+        
+        if first is None:
+             raise ValueError("range.txt contains no valid tasks.")
+        print("--- SCRIPT --- Successfully opened range.txt, tasks are parsed as they run.")
+        return chain((first,), tasks)
+
+    except FileNotFoundError:
+        print("🔴 FATAL ERROR: `range.txt` not found. Please create the file.")
+    except Exception as e:
+        print(f"🔴 FATAL ERROR: Could not read or parse `range.txt`. Details: {e}")
+    return None
+
+async def connect() -> TelegramClient:
+    """Builds and connects the client shared by every run; main() disconnects it at shutdown."""
+    client = get_client(API_ID, API_HASH, SESSION_STRING)
+    await client.connect()
+    return client
+
+async def run_tasks(client: TelegramClient, bucket: TokenBucket, log_batcher: LogBatcher, source_id: int,
+                    source_entity, destination_entity, poll_cache: dict, cursor: ResumeCursor, tasks):
+    """Executes the parsed range.txt tasks on an already connected client and logs the run's stats."""
+    # non_polls_skipped counts existing non-poll messages (batch scan); ids_without_polls counts
+    # every ID the poll search passed over, deleted or missing ones included
+    stats = {'polls_forwarded': 0, 'non_polls_skipped': 0, 'ids_without_polls': 0, 'errors': 0}
+    start_time = time.perf_counter()
+
+    # --- EXECUTE TASKS (Main Loop) ---
+    task_iter = enumerate(tasks, 1)
+    while True:
+        try:
+            i, task = next(task_iter)
+        except StopIteration:
+            break
+        except ValueError as e:
+            # A malformed line further down range.txt: the tasks before it have already run
+            stats['errors'] += 1
+            log_batcher.send(f"🔴 <b>Could not parse range.txt</b>, remaining tasks skipped.\n<b>Details:</b> <code>{e}</code>")
+            break
+
+        log_batcher.send(TASK_HEADER_TMPL, i, task['type'].upper())
+
+        try:
+            if task['type'] == 'message':
+                await send_custom_message(client, bucket, destination_entity, task['content'])
+                stats['polls_forwarded'] += 1 # Counting this as a successful "forward"
+                log_batcher.send(f"  ✍️ <b>Custom Message Sent:</b> \"{task['content'][:50]}...\"")
+
+            elif task['type'] == 'range':
+                await forward_range(
+                    client, bucket, log_batcher, source_entity, destination_entity,
+                    task['start'], task['end'], poll_cache, cursor, stats
+                )
+
+        except FloodWaitError as e:
+            wait_time = e.seconds + 5
+            stats['errors'] += 1
+            bucket.on_flood_wait(wait_time)
+            warning_msg = f"🟡 <b>FloodWaitError</b>. Pausing script for <code>{wait_time}</code> seconds."
+            log_batcher.send(warning_msg)
+            await asyncio.sleep(wait_time)
+        except Exception as e:
+            stats['errors'] += 1
+            error_summary = f"🔴 <b>Error on Task {i}</b>: <code>{type(e).__name__}</code>"
+            traceback.print_exc()
+            log_batcher.send(f"{error_summary}\n<b>Details:</b> <code>{str(e)}</code>")
+        finally:
+            if task['type'] == 'range':
+                # Kept even when the range failed part-way, so the next run skips what was already classified
+                save_poll_cache(source_id, poll_cache)
+
+    # --- FINAL REPORT ---
+    duration = timedelta(seconds=int(time.perf_counter() - start_time))
+    log_batcher.send(SUMMARY_TMPL.format(duration=duration, **stats))
+    return stats
+
 async def main():
     """Initializes the client, parses tasks, and executes the forwarding process."""
     console_prefix = "--- SCRIPT ---"
@@ -80,43 +402,13 @@ async def main():
         return
 
     # --- 2. PARSE range.txt ---
-    tasks = []
-    try:
-        with open('range.txt', 'r') as f:
-            lines = f.readlines()
-
-        start_id = None
-        for line in lines:
-            line = line.strip()
-            if not line or line.startswith('#'): continue
-            parts = line.split(':', 1)
-            if len(parts) != 2: continue
-            key, value = parts[0].strip().lower(), parts[1].strip()
-
-            if key == 'message':
-                tasks.append({'type': 'message', 'content': value})
-            elif key == 'start':
-                start_id = parse_id(value)
-            elif key == 'end' and start_id is not None:
-                end_id = parse_id(value)
-                tasks.append({'type': 'range', 'start': start_id, 'end': end_id})
-                start_id = None
-        
-        if not tasks:
-             raise ValueError("range.txt contains no valid tasks.")
-        print(f"{console_prefix} Successfully parsed {len(tasks)} tasks from range.txt.")
-
-    except FileNotFoundError:
-        print("🔴 FATAL ERROR: `range.txt` not found. Please create the file.")
-        return
-    except Exception as e:
-        print(f"🔴 FATAL ERROR: Could not read or parse `range.txt`. Details: {e}")
+    tasks = load_range_tasks()
+    if tasks is None:
         return
 
-    # --- 3. INITIALIZE AND EXECUTE ---
-    client = TelegramClient(StringSession(SESSION_STRING), API_ID, API_HASH, timeout=60)
-    stats = {'polls_forwarded': 0, 'non_polls_skipped': 0, 'errors': 0}
-    start_time = datetime.now()
+    # --- 3. INITIALIZE ---
+    # Starts at the old slowest pace and may speed up to the old fastest one
+    bucket = TokenBucket(rate=1 / MAX_DELAY_SECONDS, max_rate=1 / MIN_DELAY_SECONDS)
     log_channel_int_id = 0 # Initialize to handle early errors
 
     try:
@@ -125,11 +417,14 @@ async def main():
          print(f"🔴 FATAL ERROR: LOG_CHANNEL_ID ('{LOG_CHANNEL_ID}') is not a valid integer.")
          return
 
-    async with client:
-        await send_log(client, log_channel_int_id, "🚀 <b>Poll Forwarder Initialized</b>\nScript is starting up...")
+    client = await connect()
+    try:
+        log_batcher = LogBatcher(client, log_channel_int_id)
+        log_batcher.start()
+        log_batcher.send("🚀 <b>Poll Forwarder Initialized</b>\nScript is starting up...")
         
         me = await client.get_me()
-        await send_log(client, log_channel_int_id, f"👤 <b>Client Connected</b>\nLogged in as: <code>{me.first_name} {me.last_name or ''}</code>")
+        log_batcher.send(f"👤 <b>Client Connected</b>\nLogged in as: <code>{me.first_name} {me.last_name or ''}</code>")
         
         # --- ROBUSTNESS UPDATE: Verify all channels using integer IDs ---
         try:
@@ -137,89 +432,60 @@ async def main():
             source_id = int(SOURCE_CHANNEL)
             destination_id = int(DESTINATION_CHANNEL)
             
-            # Now get the entities using the verified integer IDs
-            source_entity = await client.get_entity(source_id)
-            destination_entity = await client.get_entity(destination_id)
-            log_entity = await client.get_entity(log_channel_int_id)
+            # Now resolve the peers using the verified integer IDs (from the entity cache when possible)
+            (source_entity, source_title), (destination_entity, destination_title), (log_peer, log_title) = (
+                await resolve_channels(client, source_id, destination_id, log_channel_int_id)
+            )
+            # Resolved once so each log send skips the session lookup for the integer ID
+            log_batcher.log_channel = log_peer
             
-            await send_log(client, log_channel_int_id, (
+            log_batcher.send((
                 f"🎯 <b>Channels Verified</b>\n"
-                f"<b>Source:</b> <code>{source_entity.title} ({source_id})</code>\n"
-                f"<b>Destination:</b> <code>{destination_entity.title} ({destination_id})</code>\n"
-                f"<b>Logs:</b> <code>{log_entity.title} ({log_channel_int_id})</code>"
+                f"<b>Source:</b> <code>{source_title} ({source_id})</code>\n"
+                f"<b>Destination:</b> <code>{destination_title} ({destination_id})</code>\n"
+                f"<b>Logs:</b> <code>{log_title} ({log_channel_int_id})</code>"
             ))
         except ValueError:
             error_msg = "💥 <b>Fatal Error</b>\nOne of the channel IDs in your secrets is not a valid integer. Please check `SOURCE_CHANNEL`, `DESTINATION_CHANNEL`, and `LOG_CHANNEL_ID`."
-            await send_log(client, log_channel_int_id, error_msg)
+            log_batcher.send(error_msg)
+            await log_batcher.close()
             return
         except Exception as e:
             error_msg = f"💥 <b>Fatal Error</b>\nCould not resolve one of the channels. <b>Ensure your account has joined all three channels.</b>\n\n<b>Details:</b>\n<code>{e}</code>"
-            await send_log(client, log_channel_int_id, error_msg)
+            log_batcher.send(error_msg)
+            await log_batcher.close()
             return
 
-        # --- 4. EXECUTE TASKS (Main Loop) ---
-        for i, task in enumerate(tasks, 1):
-            task_header = f"▶️ <b>Executing Task {i}/{len(tasks)}:</b> <code>{task['type'].upper()}</code>"
-            await send_log(client, log_channel_int_id, task_header)
-            
-            try:
-                if task['type'] == 'message':
-                    await client.send_message(destination_entity, task['content'])
-                    stats['polls_forwarded'] += 1 # Counting this as a successful "forward"
-                    await send_log(client, log_channel_int_id, f"  ✍️ <b>Custom Message Sent:</b> \"{task['content'][:50]}...\"")
-
-                elif task['type'] == 'range':
-                    start, end = task['start'], task['end']
-                    range_info = f"Processing poll range <code>{start}-{end}</code> in batches of {BATCH_SIZE}."
-                    await send_log(client, log_channel_int_id, f"  🔎 {range_info}")
-                    
-                    for batch_start in range(start, end + 1, BATCH_SIZE):
-                        batch_end = min(batch_start + BATCH_SIZE - 1, end)
-                        batch_ids = list(range(batch_start, batch_end + 1))
-                        
-                        messages = await client.get_messages(source_entity, ids=batch_ids)
-                        valid_messages = [m for m in messages if m]
-
-                        if valid_messages:
-                           await send_log(client, log_channel_int_id, f"  - Processing batch <code>{batch_start}-{batch_end}</code>, found {len(valid_messages)} valid messages.")
-                        
-                        for message in valid_messages:
-                            delay = random.uniform(MIN_DELAY_SECONDS, MAX_DELAY_SECONDS)
-                            if message.poll:
-                                await message.forward_to(destination_entity)
-                                stats['polls_forwarded'] += 1
-                                print(f"    ✅ FORWARDED: Poll from message ID {message.id}.")
-                                await asyncio.sleep(delay)
-                            else:
-                                stats['non_polls_skipped'] += 1
-                        
-                        await asyncio.sleep(1) # Small pause between batches
-
-            except FloodWaitError as e:
-                wait_time = e.seconds + 5
-                stats['errors'] += 1
-                warning_msg = f"🟡 <b>FloodWaitError</b>. Pausing script for <code>{wait_time}</code> seconds."
-                await send_log(client, log_channel_int_id, warning_msg)
-                await asyncio.sleep(wait_time)
-            except Exception as e:
-                stats['errors'] += 1
-                error_summary = f"🔴 <b>Error on Task {i}</b>: <code>{type(e).__name__}</code>"
-                traceback.print_exc()
-                await send_log(client, log_channel_int_id, f"{error_summary}\n<b>Details:</b> <code>{str(e)}</code>")
-
-        # --- 5. FINAL REPORT ---
-        end_time = datetime.now()
-        duration = str(end_time - start_time).split('.')[0]
-        summary = (
-            f"🎉 <b>All Tasks Complete!</b> 🎉\n\n"
-            f"<b>📊 Final Stats:</b>\n"
-            f"  - <b>Polls Forwarded:</b> <code>{stats['polls_forwarded']}</code>\n"
-            f"  - <b>Non-Polls Skipped:</b> <code>{stats['non_polls_skipped']}</code>\n"
-            f"  - <b>Errors Encountered:</b> <code>{stats['errors']}</code>\n\n"
-            f"⏱️ <b>Total Duration:</b> <code>{duration}</code>"
-        )
-        await send_log(client, log_channel_int_id, summary)
+        poll_cache = load_poll_cache(source_id)
+        cursor = ResumeCursor(source_id, destination_id, reset=RESET_CURSOR)
+        if RESET_CURSOR:
+            log_batcher.send("♻️ <b>Resume points reset</b>: interrupted ranges start over.")
+
+        # --- 4. EXECUTE ---
+        await run_tasks(client, bucket, log_batcher, source_id, source_entity, destination_entity, poll_cache, cursor, tasks)
+
+        # --- 5. WATCH MODE: re-run range.txt on the same connection whenever it changes ---
+        if WATCH_INTERVAL > 0:
+            log_batcher.send(f"👀 <b>Watching range.txt</b> for changes every <code>{WATCH_INTERVAL}</code> seconds.")
+            last_mtime = os.stat(RANGE_FILE).st_mtime
+            while True:
+                await asyncio.sleep(WATCH_INTERVAL)
+                try:
+                    mtime = os.stat(RANGE_FILE).st_mtime
+                except FileNotFoundError:
+                    continue
+                if mtime == last_mtime:
+                    continue
+                last_mtime = mtime
+                tasks = load_range_tasks()
+                if tasks:
+                    await run_tasks(client, bucket, log_batcher, source_id, source_entity, destination_entity, poll_cache, cursor, tasks)
+
+        await log_batcher.close()
+    finally:
+        await client.disconnect()
 
 if __name__ == "__main__":
+    configure_logging()
+    install_uvloop()
     asyncio.run(main())
-        
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Adaptive token bucket used to pace Telegram calls.
+
+    The refill rate follows AIMD: it grows additively after every successful
+    call and is divided when Telegram answers with a FloodWaitError, so the
+    scripts settle just below the server's real limit instead of sleeping a
+    fixed amount every time.
+    """
+
+    def __init__(self, rate, max_rate, min_rate=0.05, capacity=1, increase=0.05, decrease=2.0):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def acquire(self):
+        """Waits until a token is available and consumes it."""
+        async with self._lock:
+            while True:
+                # Checked again after every sleep, so a flood wait reported meanwhile holds this caller too
+                if (pause := self.resume_at - time.monotonic()) > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    break
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+            self.tokens -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Only successes are counted here; callers report flood waits with the wait time
+        if exc_type is None:
+            self.on_success()
+        return False
+
+    def on_success(self):
+        """Raises the rate by one additive step after a call went through."""
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_flood_wait(self, seconds=0):
+        """Cuts the rate, empties the bucket and, when `seconds` is given, holds
+        every acquire() until the flood wait Telegram asked for has passed."""
+        self.rate = max(self.min_rate, self.rate / self.decrease)
+        now = time.monotonic()
+        self.tokens = 0
+        # Refilling restarts now, so no tokens are credited for the time before the flood wait
+        self.last_refill = now
+        self.resume_at = max(self.resume_at, now + seconds)
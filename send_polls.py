@@ -1,51 +1,279 @@
 import asyncio
-import nest_asyncio
+import html
 import os
 import json
-import glob
+import logging
+import random
+import sys
+from functools import lru_cache, partial
+
+import httpx  # Installed with python-telegram-bot, which sends through it
 from telegram import Bot
-from telegram.error import BadRequest
-from telegram.helpers import escape_markdown
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.request import HTTPXRequest
+
+from batching import MESSAGE_LIMIT, MessageBatcher
+from ratelimit import TokenBucket
+
+# ijson parses the item file incrementally; without it the whole file is loaded at once,
+# with orjson when installed (it parses the raw bytes directly) or the standard json module
+try:
+    import ijson
+except ImportError:
+    ijson = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+# What a malformed item file raises while it is read: json and orjson decode errors are
+# ValueErrors, ijson's are not
+JSON_ERRORS = (ValueError, ijson.JSONError) if ijson is not None else (ValueError,)
 
-# Allow nested asyncio
-nest_asyncio.apply()
+# HTTP/2 needs the h2 package (python-telegram-bot[http2]); without it the pool uses HTTP/1.1 keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP_VERSION = "2"
+except ImportError:
+    HTTP_VERSION = "1.1"
+
+# Allow nested asyncio only when asked (e.g. running inside Jupyter); asyncio.run in
+# __main__ never nests, so the default run leaves the event loop unpatched
+if os.getenv("NESTED_LOOP"):
+    import nest_asyncio
+    nest_asyncio.apply()
 
 # ====== CONFIGURATION ======
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 # MODIFIED: Chat ID is now hardcoded directly into the script
 CHAT_ID = -1002478655415 
+# Telegram lets a bot post about 20 messages per minute to one group or channel
+MAX_MESSAGES_PER_MINUTE = 20
+# Retries for transient network errors: exponential backoff from RETRY_BASE_SECONDS, capped at RETRY_MAX_SECONDS
+# Only errors raised before the request left are retried; after a read timeout Telegram may
+# already have posted the message, and a resend would post it twice
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+MAX_RETRIES = 5
+RETRY_BASE_SECONDS = 1
+RETRY_MAX_SECONDS = 30
+SEND_QUEUE_SIZE = 10 # Items prepared ahead of the one being sent
+CONNECTION_POOL_SIZE = 4 # Kept-alive connections shared by the sender and error reports
+# Telegram's limits for poll questions, options and quiz explanations
+QUESTION_LIMIT = 300
+OPTION_LIMIT = 100
+EXPLANATION_LIMIT = 200
+EXPLANATION_MAX_LINE_FEEDS = 2
+QUESTION_PREFIX = "[MediX]\n" # Prepended to every poll question
+# MarkdownV2 headers of the explanation messages: for quizzes whose explanation didn't fit, and for regular polls
+QUIZ_EXPLANATION_HEADER = "_*Explanation:*_\n"
+POLL_EXPLANATION_HEADER = "📝 *Explanation*\n\n"
+ERROR_MESSAGE_HEADER = "🤖 BOT ERROR 🤖\n\n" # Header of the HTML error reports
+INVALID_REPORT_LIMIT = 50 # Invalid items listed individually in the end-of-run report
+# Error reports are coalesced: up to ERROR_BATCH_SIZE reports or ERROR_FLUSH_SECONDS per message
+ERROR_BATCH_SIZE = 10
+ERROR_FLUSH_SECONDS = 2
+# JSON state files forward_script.py keeps in the same directory; never question banks
+STATE_FILES = {'polls_cache.json', 'cursor.json'}
+
+# Console progress from the sending loop; startup and fatal messages stay plain prints
+log = logging.getLogger('send_polls')
+
+# Characters MarkdownV2 requires escaping, mapped once to their backslash-escaped form
+MARKDOWN_V2_ESCAPES = str.maketrans({char: '\\' + char for char in r'\_*[]()~`>#+-=|{}.!'})
 
 # ====== FUNCTIONS ======
 
+@lru_cache(maxsize=4096)
+def escape_markdown_v2(text):
+    """Escapes text for parse_mode='MarkdownV2' (same result as telegram.helpers.escape_markdown(version=2)).
+
+    Cached, since question banks repeat the same boilerplate explanations.
+    """
+    return text.translate(MARKDOWN_V2_ESCAPES)
+
 def find_json_file():
-    """Finds the first .json file in the repository's root directory."""
-    json_files = glob.glob('*.json')
-    if json_files:
-        print(f"✅ Found JSON file: {json_files[0]}")
-        return json_files[0]
-    else:
-        print("❌ No .json file found in the repository.")
-        return None
-
-def load_items(file_path):
-    """Loads items (polls or messages) from a specified JSON file."""
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            items = json.load(f)
-        print(f"✅ Successfully loaded {len(items)} items from {file_path}")
-        return items
-    except FileNotFoundError:
-        return []
-    except json.JSONDecodeError:
-        print(f"❌ Error: The file {file_path} is not a valid JSON file.")
-        return []
-
-async def send_error_to_telegram(bot, error_message):
+    """Finds the first .json file in the repository's root directory.
+
+    Stops at the first match instead of listing the whole directory. Hidden
+    files and the forwarder's state files are skipped.
+    """
+    with os.scandir('.') as entries:
+        for entry in entries:
+            if (entry.name.endswith('.json') and not entry.name.startswith('.')
+                    and entry.name not in STATE_FILES and entry.is_file()):
+                print(f"✅ Found JSON file: {entry.name}")
+                return entry.name
+    print("❌ No .json file found in the repository.")
+    return None
+
+def iter_items(file_path):
+    """Yields the items (polls or messages) of a JSON array file one at a time.
+
+    With ijson installed the file is parsed as it is read, so sending starts
+    before a large file has been fully loaded.
+    """
+    with open(file_path, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.items(f, 'item')
+            return
+        items = orjson.loads(f.read()) if orjson is not None else json.load(f)
+    if not isinstance(items, list):
+        raise ValueError("expected a JSON array of items")
+    yield from items
+
+def validate_item(item):
+    """Returns why an item can't be sent, or None when it is valid."""
+    if not isinstance(item, dict):
+        return "not a JSON object"
+    content_type = item.get('type', 'poll')
+    if content_type == 'message':
+        text = item.get('text')
+        if not text:
+            return "message has no 'text'"
+        return None if isinstance(text, str) else "message 'text' must be text"
+    if content_type != 'poll':
+        return f"unknown type '{content_type}'"
+
+    question, options = item.get('question'), item.get('options')
+    if not question:
+        return "poll has no 'question'"
+    if not isinstance(question, str):
+        return "poll 'question' must be text"
+    if len(QUESTION_PREFIX) + len(question) > QUESTION_LIMIT:
+        return f"question is longer than {QUESTION_LIMIT - len(QUESTION_PREFIX)} characters"
+    if not isinstance(options, list) or len(options) < 2:
+        return "poll needs at least 2 'options'"
+    if any(not isinstance(option, str) or len(option) > OPTION_LIMIT for option in options):
+        return f"options must be text of at most {OPTION_LIMIT} characters"
+    explanation = item.get('explanation')
+    if explanation is not None and not isinstance(explanation, str):
+        return "'explanation' must be text"
+    correct_option_id = item.get('correct_option')
+    if correct_option_id is not None and (
+        isinstance(correct_option_id, bool) or not isinstance(correct_option_id, int)
+        or not 0 <= correct_option_id < len(options)
+    ):
+        return "'correct_option' is not an index into 'options'"
+    return None
+
+async def send_error_to_telegram(bot, bucket, error_message):
     """Sends a formatted error message to the Telegram channel."""
     try:
-        await bot.send_message(chat_id=CHAT_ID, text=f"🤖 BOT ERROR 🤖\n\n<pre>{error_message}</pre>", parse_mode='HTML')
+        await send_paced(bucket, bot.send_message, chat_id=CHAT_ID, text=ERROR_MESSAGE_HEADER + error_message, parse_mode=ParseMode.HTML)
     except Exception as e:
-        print(f"❌ CRITICAL: Failed to send error message to Telegram: {e}")
+        log.critical("❌ CRITICAL: Failed to send error message to Telegram: %s", e)
+
+def render_error(error_message):
+    """Formats one queued error report for the HTML error message."""
+    return f"<pre>{html.escape(error_message, quote=False)}</pre>"
+
+async def send_paced(bucket, send, **kwargs):
+    """Calls a Bot send method under the rate limiter, retrying transient failures.
+
+    RetryAfter waits exactly as long as Telegram asks (through the bucket, so
+    later sends wait too); connection errors and connect or pool timeouts back off
+    exponentially with jitter. Any other NetworkError (e.g. a read timeout, when
+    the message may already be posted) and BadRequest are never retried.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with bucket:
+                return await send(**kwargs)
+        except BadRequest:
+            raise
+        except RetryAfter as e:
+            if attempt == MAX_RETRIES:
+                raise
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            log.warning("    🟡 Flood control: retrying in %s seconds.", retry_after)
+            bucket.on_flood_wait(retry_after)
+        except NetworkError as e:
+            # HTTPXRequest chains the httpx error that caused the NetworkError
+            if attempt == MAX_RETRIES or not isinstance(e.__cause__, UNSENT_ERRORS):
+                raise
+            delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt) * (1 + random.random() / 2)
+            log.warning("    🟡 %s: %s. Retrying in %.1f seconds.", type(e).__name__, e, delay)
+            await asyncio.sleep(delay)
+
+async def send_quiz(bot, bucket, question_text, options, correct_option_id, explanation_text):
+    """Sends a quiz poll and returns True when its explanation still has to go out
+    as a separate message.
+
+    Explanations Telegram would reject are left off up front, saving a failed
+    send_poll. A "message is too long" BadRequest is retried without the
+    explanation; any other error propagates unchanged to the caller.
+    """
+    separate_explanation = bool(explanation_text) and (
+        len(explanation_text) > EXPLANATION_LIMIT or explanation_text.count("\n") > EXPLANATION_MAX_LINE_FEEDS
+    )
+    if separate_explanation:
+        log.warning("    ⚠️ Warning: Explanation is too long. Sending as a separate message.")
+    quiz = dict(
+        chat_id=CHAT_ID,
+        question=question_text,
+        options=options,
+        is_anonymous=True,
+        type="quiz",
+        correct_option_id=correct_option_id,
+    )
+    try:
+        await send_paced(bucket, bot.send_poll, explanation=None if separate_explanation else explanation_text, **quiz)
+        return separate_explanation
+    except BadRequest as e:
+        # Safety net for limits the local check doesn't model (e.g. length after entity parsing)
+        if separate_explanation or not explanation_text or "message is too long" not in str(e).lower():
+            raise
+    log.warning("    ⚠️ Warning: Explanation is too long. Sending as a separate message.")
+    await send_paced(bucket, bot.send_poll, explanation=None, **quiz)
+    return True
+
+async def send_item(bot, bucket, item):
+    """Sends one message or poll item (plus its explanation, if any) to the chat."""
+    content_type = item.get('type', 'poll')
+    if content_type == 'message':
+        await send_paced(bucket, bot.send_message, chat_id=CHAT_ID, text=item['text'], parse_mode=ParseMode.HTML)
+
+    elif content_type == 'poll':
+        question_text = QUESTION_PREFIX + item['question']
+        explanation_text = item.get('explanation')
+        options = tuple(item["options"]) # Built once; the fallback send and any retries reuse it
+        correct_option_id = item.get('correct_option')
+
+        if correct_option_id is not None:
+            log.debug("    Type: Quiz Poll")
+            separate_explanation = await send_quiz(bot, bucket, question_text, options, correct_option_id, explanation_text)
+
+            if separate_explanation:
+                full_text = QUIZ_EXPLANATION_HEADER + escape_markdown_v2(explanation_text)
+
+                await send_paced(
+                    bucket, bot.send_message,
+                    chat_id=CHAT_ID,
+                    text=full_text,
+                    parse_mode=ParseMode.MARKDOWN_V2
+                )
+
+        else:
+            log.debug("    Type: Regular Poll")
+            await send_paced(
+                bucket, bot.send_poll,
+                chat_id=CHAT_ID,
+                question=question_text,
+                options=options,
+                is_anonymous=True,
+                type="regular" 
+            )
+
+            if explanation_text:
+                full_explanation = POLL_EXPLANATION_HEADER + escape_markdown_v2(explanation_text)
+
+                log.debug("    Sending separate explanation message.")
+                await send_paced(
+                    bucket, bot.send_message,
+                    chat_id=CHAT_ID,
+                    text=full_explanation,
+                    parse_mode=ParseMode.MARKDOWN_V2
+                )
 
 async def process_content():
     """Main function to process and send all content from the JSON file."""
@@ -54,99 +282,103 @@ async def process_content():
         print("❌ Error: BOT_TOKEN or CHAT_ID is not set. Aborting.")
         return
 
-    bot = Bot(token=BOT_TOKEN)
-    json_file = find_json_file()
+    # One Bot (and one HTTP connection pool) for the whole run; `async with` initializes it once and closes it at the end
+    request = HTTPXRequest(
+        connection_pool_size=CONNECTION_POOL_SIZE, http_version=HTTP_VERSION, connect_timeout=10, read_timeout=30
+    )
+    async with Bot(token=BOT_TOKEN, request=request) as bot:
+        # Paces every send to the chat, error reports included: starts at the old fixed 4 s spacing and speeds up to the per-chat limit
+        bucket = TokenBucket(rate=1 / 4, max_rate=MAX_MESSAGES_PER_MINUTE / 60)
+        # Error reports are sent from a background task, so a failing item never waits on its report
+        errors = MessageBatcher(
+            partial(send_error_to_telegram, bot, bucket), ERROR_FLUSH_SECONDS, max_items=ERROR_BATCH_SIZE,
+            limit=MESSAGE_LIMIT - len(ERROR_MESSAGE_HEADER), render=render_error
+        )
+        errors.start()
+        try:
+            json_file = find_json_file()
 
-    if not json_file:
-        await send_error_to_telegram(bot, "Could not find any .json file to process.")
-        return
+            if not json_file:
+                errors.put("Could not find any .json file to process.")
+                return
 
-    item_list = load_items(json_file)
-    if not item_list:
-        await send_error_to_telegram(bot, f"File '{json_file}' is empty or invalid.")
-        return
+            queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
 
-    print("\nStarting to send content...")
-    for i, item in enumerate(item_list, start=1):
-        content_type = item.get('type', 'poll')
-        print(f"--> Processing item {i} of {len(item_list)} (type: {content_type})...")
+            invalid = [] # Items that failed validation, reported together once the run ends
 
-        try:
-            if content_type == 'message':
-                await bot.send_message(chat_id=CHAT_ID, text=item['text'], parse_mode='HTML')
-            
-            elif content_type == 'poll':
-                question_text = f"[MediX]\n{item['question']}"
-                explanation_text = item.get('explanation')
-                correct_option_id = item.get('correct_option')
-
-                if correct_option_id is not None:
-                    print("    Type: Quiz Poll")
+            # Validation happens here, so malformed items never reach the sender or use any of the rate limit
+            async def producer():
+                read = 0
+                try:
+                    items = iter_items(json_file)
+                    while True:
+                        # Only the parse is guarded here, so a validation problem can never pass as invalid JSON
+                        try:
+                            item = next(items)
+                        except StopIteration:
+                            break
+                        except JSON_ERRORS as e:
+                            # A parse error part-way through; reported by the sender
+                            await queue.put(ValueError(f"File '{json_file}' is not valid JSON after item #{read}: {e}"))
+                            return
+                        read += 1
+                        if problem := validate_item(item):
+                            invalid.append(f"#{read}: {problem}")
+                            continue
+                        await queue.put((read, item))
+                except Exception as e:
+                    # Anything else (e.g. the file can't be opened) still ends the run through the sender
+                    await queue.put(RuntimeError(f"Stopped reading '{json_file}' after item #{read}: {type(e).__name__}: {e}"))
+                    return
+                await queue.put(None)
+
+            # A single sender keeps the channel in JSON order; the bucket sets the pace, not the number of senders
+            async def sender():
+                sent = 0
+                while (entry := await queue.get()) is not None:
+                    if isinstance(entry, Exception):
+                        errors.put(str(entry))
+                        return None
+                    i, item = entry
+                    sent += 1
+                    content_type = item.get('type', 'poll')
+                    log.info("--> Processing item %d (type: %s)...", i, content_type)
                     try:
-                        await bot.send_poll(
-                            chat_id=CHAT_ID,
-                            question=question_text,
-                            options=item["options"],
-                            is_anonymous=True,
-                            type="quiz",
-                            correct_option_id=correct_option_id,
-                            explanation=explanation_text
-                        )
-                    except BadRequest as e:
-                        if "message is too long" in str(e).lower() and explanation_text:
-                            print("    ⚠️ Warning: Explanation is too long. Sending as a separate message.")
-                            await bot.send_poll(
-                                chat_id=CHAT_ID,
-                                question=question_text,
-                                options=item["options"],
-                                is_anonymous=True,
-                                type="quiz",
-                                correct_option_id=correct_option_id,
-                                explanation=None
-                            )
-                            escaped_explanation = escape_markdown(explanation_text, version=2)
-                            full_text = f"_*Explanation:*_\n{escaped_explanation}"
-                            
-                            await bot.send_message(
-                                chat_id=CHAT_ID,
-                                text=full_text,
-                                parse_mode='MarkdownV2'
-                            )
-                        else:
-                            raise 
-                
-                else:
-                    print("    Type: Regular Poll")
-                    await bot.send_poll(
-                        chat_id=CHAT_ID,
-                        question=question_text,
-                        options=item["options"],
-                        is_anonymous=True,
-                        type="regular" 
-                    )
-
-                    if explanation_text:
-                        explanation_header = "📝 *Explanation*" 
-                        escaped_explanation = escape_markdown(explanation_text, version=2)
-                        full_explanation = f"{explanation_header}\n\n{escaped_explanation}"
-                        
-                        print("    Sending separate explanation message.")
-                        await bot.send_message(
-                            chat_id=CHAT_ID,
-                            text=full_explanation,
-                            parse_mode='MarkdownV2'
-                        )
+                        await send_item(bot, bucket, item)
+                    except Exception as e:
+                        error_details = f"Failed to send item #{i}.\nType: {content_type}\nError: {e}"
+                        log.error("❌ %s", error_details)
+                        errors.put(error_details)
+                return sent
 
-            await asyncio.sleep(4)
+            print("\nStarting to send content...")
+            producer_task = asyncio.create_task(producer())
+            try:
+                total = await sender()
+            finally:
+                producer_task.cancel()
 
-        except Exception as e:
-            error_details = f"Failed to send item #{i}.\nType: {content_type}\nError: {e}"
-            print(f"❌ {error_details}")
-            await send_error_to_telegram(bot, error_details)
+            if invalid:
+                report = "\n".join(invalid[:INVALID_REPORT_LIMIT])
+                if len(invalid) > INVALID_REPORT_LIMIT:
+                    report += f"\n...and {len(invalid) - INVALID_REPORT_LIMIT} more"
+                report = f"Skipped {len(invalid)} invalid items in '{json_file}':\n{report}"
+                log.warning("⚠️ %s", report)
+                errors.put(report)
 
-    print("\n✅ Finished sending all content.")
+            if total is None:
+                return # The read error was already reported by the sender
+            if total == 0 and not invalid:
+                errors.put(f"File '{json_file}' is empty or invalid.")
+                return
+            print(f"\n✅ Finished sending all content ({total} items).")
+        finally:
+            await errors.close()
 
 # ====== MAIN EXECUTION BLOCK ======
 if __name__ == "__main__":
+    # Same setup as common.configure_logging, which this script can't import without Telethon.
+    # LOG_LEVEL (default INFO): DEBUG adds per-item detail, WARNING keeps only problems
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format='%(message)s', stream=sys.stdout)
     asyncio.run(process_content())
                         